@@ -13,8 +13,10 @@ class Settings:
     outbound_rps: int = int(os.getenv("OUTBOUND_RPS", "10"))
     batch_size: int = int(os.getenv("BATCH_SIZE", "10"))
     batch_flush_seconds: float = float(os.getenv("BATCH_FLUSH_SECONDS", "0.75"))
+    max_inflight_batches: int = int(os.getenv("MAX_INFLIGHT_BATCHES", "4"))
     max_retries: int = int(os.getenv("MAX_RETRIES", "3"))
     backoff_seconds: float = float(os.getenv("BACKOFF_SECONDS", "1.5"))
+    shutdown_timeout_seconds: float = float(os.getenv("SHUTDOWN_TIMEOUT_SECONDS", "10"))
 
 
 settings = Settings()
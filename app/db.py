@@ -1,30 +1,104 @@
-import json
-from datetime import datetime
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import aiosqlite
+import orjson
 
 from app.config import settings
 from app.models import InsightsQuery, InsightPayload
 
 
+_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-64000;
+PRAGMA mmap_size=268435456;
+"""
+
+_conn: Optional[aiosqlite.Connection] = None
+_connect_lock = asyncio.Lock()
+# Serializes writers on the shared connection so transactions never interleave
+_write_lock = asyncio.Lock()
+
+
 async def get_connection() -> aiosqlite.Connection:
-    Path(settings.db_path).parent.mkdir(parents=True, exist_ok=True)
-    conn = await aiosqlite.connect(settings.db_path)
-    conn.row_factory = aiosqlite.Row
-    return conn
+    global _conn
+    if _conn is not None:
+        return _conn
+    async with _connect_lock:
+        if _conn is None:
+            Path(settings.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = await aiosqlite.connect(settings.db_path)
+            conn.row_factory = aiosqlite.Row
+            await conn.executescript(_PRAGMAS)
+            _conn = conn
+    return _conn
+
+
+# One writer + N read-only connections so reads run in parallel against the WAL snapshot
+class ReadPool:
+    def __init__(self, size: int):
+        self.size = size
+        self._queue: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._conns: List[aiosqlite.Connection] = []
+        self._open_lock = asyncio.Lock()
+
+    async def _open(self) -> None:
+        async with self._open_lock:
+            if self._conns:
+                return
+            # The writer creates the database file; read-only URIs cannot
+            await get_connection()
+            for _ in range(self.size):
+                conn = await aiosqlite.connect(f"file:{settings.db_path}?mode=ro", uri=True)
+                conn.row_factory = aiosqlite.Row
+                await conn.execute("PRAGMA query_only=1")
+                self._conns.append(conn)
+                self._queue.put_nowait(conn)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        if not self._conns:
+            await self._open()
+        conn = await self._queue.get()
+        try:
+            yield conn
+        finally:
+            self._queue.put_nowait(conn)
+
+    async def close(self) -> None:
+        conns, self._conns = self._conns, []
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        for conn in conns:
+            await conn.close()
+
+
+read_pool = ReadPool(size=os.cpu_count() or 4)
+
+
+async def close_connection() -> None:
+    global _conn
+    await read_pool.close()
+    if _conn is not None:
+        conn, _conn = _conn, None
+        await conn.close()
 
 
 async def init_db() -> None:
     conn = await get_connection()
-    try:
+    async with _write_lock:
         await conn.execute(
             """
             CREATE TABLE IF NOT EXISTS conversations (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 conversation_id TEXT UNIQUE,
                 payload TEXT NOT NULL,
+                prompt_text TEXT,
                 status TEXT NOT NULL,
                 error TEXT,
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP,
@@ -32,6 +106,35 @@ async def init_db() -> None:
             )
             """
         )
+        # Migration for databases created before prompt_text existed; backfill from the stored payload.
+        # The trim set mirrors str.strip() (ASCII whitespace) so backfilled text matches combined_text.
+        async with conn.execute("PRAGMA table_info(conversations)") as cur:
+            columns = {row["name"] for row in await cur.fetchall()}
+        if "prompt_text" not in columns:
+            await conn.execute("ALTER TABLE conversations ADD COLUMN prompt_text TEXT")
+            await conn.execute(
+                """
+                UPDATE conversations SET prompt_text = (
+                    SELECT group_concat(trim(json_extract(value, '$.text'), ' ' || char(9, 10, 11, 12, 13)), char(10))
+                    FROM json_each(conversations.payload, '$.messages')
+                    WHERE trim(json_extract(value, '$.text'), ' ' || char(9, 10, 11, 12, 13)) != ''
+                )
+                """
+            )
+        # One-time migration: rows written before timestamps moved to CURRENT_TIMESTAMP used
+        # isoformat() ("YYYY-MM-DDTHH:MM:SS.ffffff"). Normalize them so created_at sorts correctly.
+        async with conn.execute("PRAGMA user_version") as cur:
+            user_version = (await cur.fetchone())[0]
+        if user_version < 1:
+            await conn.execute(
+                """
+                UPDATE conversations
+                SET created_at = substr(replace(created_at, 'T', ' '), 1, 19),
+                    updated_at = substr(replace(updated_at, 'T', ' '), 1, 19)
+                WHERE instr(created_at, 'T') > 0 OR instr(updated_at, 'T') > 0
+                """
+            )
+            await conn.execute("PRAGMA user_version = 1")
         await conn.execute(
             """
             CREATE TABLE IF NOT EXISTS insights (
@@ -47,84 +150,112 @@ async def init_db() -> None:
             )
             """
         )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_conv_status_created ON conversations(status, created_at)"
+        )
+        # Leading created_at also serves plain time-window scans, so no separate created_at index
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_insights_created_conf ON insights(created_at DESC, confidence, sentiment_score)"
+        )
         await conn.commit()
-    finally:
-        await conn.close()
 
 
-async def enqueue_conversation(conversation_id: str, payload: Dict[str, Any]) -> None:
-    now = datetime.utcnow().isoformat()
+async def analyze() -> None:
+    # Refresh planner statistics so the indexes above are actually chosen. Called once at app
+    # startup (not from init_db, which runs twice per boot); analysis_limit bounds the per-index scan.
     conn = await get_connection()
-    try:
-        await conn.execute(
-            """
-            INSERT OR REPLACE INTO conversations (
-                conversation_id, payload, status, error, created_at, updated_at
-            ) VALUES (?, ?, 'queued', NULL, COALESCE((SELECT created_at FROM conversations WHERE conversation_id = ?), ?), ?)
-            """,
-            (conversation_id, json.dumps(payload), conversation_id, now, now),
-        )
+    async with _write_lock:
+        await conn.execute("PRAGMA analysis_limit=1000")
+        await conn.execute("ANALYZE")
         await conn.commit()
-    finally:
-        await conn.close()
+
+
+async def enqueue_conversations(items: Sequence[Tuple[str, str, str]]) -> None:
+    # items are (conversation_id, payload_json, prompt_text); payloads arrive pre-serialized
+    if not items:
+        return
+    conn = await get_connection()
+    async with _write_lock:
+        try:
+            await conn.executemany(
+                """
+                INSERT INTO conversations (conversation_id, payload, prompt_text, status) VALUES (?, ?, ?, 'queued')
+                ON CONFLICT(conversation_id) DO UPDATE SET
+                    payload = excluded.payload,
+                    prompt_text = excluded.prompt_text,
+                    status = 'queued',
+                    error = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                [
+                    (conversation_id, payload_json, prompt_text)
+                    for conversation_id, payload_json, prompt_text in items
+                ],
+            )
+            await conn.commit()
+        except Exception:
+            # Leave no half-applied batch on the shared connection; callers may retry row by row
+            await conn.rollback()
+            raise
 
 
 async def mark_status(conversation_ids: Sequence[str], status: str, error: Optional[str] = None) -> None:
     if not conversation_ids:
         return
-    now = datetime.utcnow().isoformat()
     conn = await get_connection()
-    try:
-        await conn.executemany(
-            """
-            UPDATE conversations
-            SET status = ?, error = ?, updated_at = ?
-            WHERE conversation_id = ?
-            """,
-            [(status, error, now, cid) for cid in conversation_ids],
-        )
+    # Chunks are padded to batch_size (duplicate ids are harmless in IN) so the statement text
+    # never changes and stays in sqlite3's prepared-statement cache
+    size = settings.batch_size
+    sql = f"UPDATE conversations SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE conversation_id IN ({','.join('?' * size)})"
+    async with _write_lock:
+        for start in range(0, len(conversation_ids), size):
+            chunk = list(conversation_ids[start : start + size])
+            chunk += [chunk[-1]] * (size - len(chunk))
+            await conn.execute(sql, (status, error, *chunk))
         await conn.commit()
-    finally:
-        await conn.close()
 
 
-async def fetch_conversations(conversation_ids: Sequence[str]) -> List[aiosqlite.Row]:
+async def claim_conversations(conversation_ids: Sequence[str]) -> List[aiosqlite.Row]:
+    # Atomically flips queued rows to processing and returns what the worker needs (SQLite 3.35+).
+    # Rows already claimed or finished are skipped, so duplicate queue entries are harmless.
     if not conversation_ids:
         return []
     placeholders = ",".join("?" for _ in conversation_ids)
     conn = await get_connection()
-    try:
-        cur = await conn.execute(
-            f"SELECT conversation_id, payload, status FROM conversations WHERE conversation_id IN ({placeholders})",
+    async with _write_lock:
+        async with conn.execute(
+            f"""
+            UPDATE conversations
+            SET status = 'processing', updated_at = CURRENT_TIMESTAMP
+            WHERE conversation_id IN ({placeholders}) AND status = 'queued'
+            RETURNING conversation_id, prompt_text
+            """,
             tuple(conversation_ids),
-        )
-        rows = await cur.fetchall()
-    finally:
-        await conn.close()
+        ) as cur:
+            rows = await cur.fetchall()
+        await conn.commit()
     return rows
 
 
-async def load_outstanding(limit: int) -> List[str]:
-    conn = await get_connection()
-    try:
-        cur = await conn.execute(
-            """
+async def load_outstanding(limit: int, statuses: Sequence[str] = ("queued", "processing")) -> List[str]:
+    placeholders = ",".join("?" for _ in statuses)
+    async with read_pool.acquire() as conn:
+        async with conn.execute(
+            f"""
             SELECT conversation_id FROM conversations
-            WHERE status IN ('queued', 'processing')
+            WHERE status IN ({placeholders})
             ORDER BY created_at ASC
             LIMIT ?
             """,
-            (limit,),
-        )
-        rows = await cur.fetchall()
-    finally:
-        await conn.close()
+            (*statuses, limit),
+        ) as cur:
+            rows = await cur.fetchall()
     return [r[0] for r in rows]
 
 
 async def store_insights(insights: Iterable[InsightPayload]) -> None:
     conn = await get_connection()
-    try:
+    async with _write_lock:
         await conn.executemany(
             """
             INSERT INTO insights (
@@ -135,18 +266,16 @@ async def store_insights(insights: Iterable[InsightPayload]) -> None:
                 (
                     insight.conversation_id,
                     insight.sentiment_score,
-                    json.dumps(insight.clusters),
+                    orjson.dumps(insight.clusters).decode(),
                     insight.confidence,
                     insight.reasoning,
                     insight.model,
-                    json.dumps(insight.raw_response),
+                    orjson.dumps(insight.raw_response).decode(),
                 )
                 for insight in insights
             ],
         )
         await conn.commit()
-    finally:
-        await conn.close()
 
 
 async def query_insights(filters: InsightsQuery) -> Tuple[List[Dict[str, Any]], int]:
@@ -163,33 +292,26 @@ async def query_insights(filters: InsightsQuery) -> Tuple[List[Dict[str, Any]],
         elif filters.sentiment == "neutral":
             clauses.append("sentiment_score BETWEEN -0.2 AND 0.2")
     where = " AND ".join(clauses)
-    conn = await get_connection()
-    try:
-        data_cursor = await conn.execute(
-            f"SELECT conversation_id, sentiment_score, clusters, confidence, reasoning, model, created_at FROM insights WHERE {where} ORDER BY created_at DESC LIMIT ?",
+    # COUNT(*) OVER () is evaluated before LIMIT, so one pass yields both the page and the total
+    async with read_pool.acquire() as conn:
+        async with conn.execute(
+            f"SELECT conversation_id, sentiment_score, clusters AS clusters_json, confidence, reasoning, model, created_at, COUNT(*) OVER () AS total_count FROM insights WHERE {where} ORDER BY created_at DESC LIMIT ?",
             (*params, filters.limit),
-        )
-        rows = await data_cursor.fetchall()
-
-        count_cursor = await conn.execute(
-            f"SELECT COUNT(1) FROM insights WHERE {where}",
-            tuple(params),
-        )
-        total_count = (await count_cursor.fetchone())[0]
-    finally:
-        await conn.close()
+        ) as data_cursor:
+            rows = await data_cursor.fetchall()
+    total_count = rows[0]["total_count"] if rows else 0
 
-    results = []
-    for row in rows:
-        results.append(
-            {
-                "conversation_id": row["conversation_id"],
-                "sentiment_score": row["sentiment_score"],
-                "clusters": json.loads(row["clusters"] or "[]"),
-                "confidence": row["confidence"],
-                "reasoning": row["reasoning"],
-                "model": row["model"],
-                "created_at": row["created_at"],
-            }
-        )
+    # clusters is already JSON text; a Fragment is spliced into the response verbatim by orjson
+    results = [
+        {
+            "conversation_id": row["conversation_id"],
+            "sentiment_score": row["sentiment_score"],
+            "clusters": orjson.Fragment(row["clusters_json"] or "[]"),
+            "confidence": row["confidence"],
+            "reasoning": row["reasoning"],
+            "model": row["model"],
+            "created_at": row["created_at"],
+        }
+        for row in rows
+    ]
     return results, total_count
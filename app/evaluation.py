@@ -1,8 +1,10 @@
 import asyncio
 from dataclasses import dataclass
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-from app.grok_client import GrokClient
+from app.config import settings
+from app.grok_client import GrokClient, current_shared_client
+from app.rate_limiter import TokenBucket
 
 
 @dataclass
@@ -28,15 +30,30 @@ def sentiment_bucket(score: float) -> int:
     return 0
 
 
-async def evaluate_models(models: List[str]) -> Dict[str, float]:
-    results: Dict[str, float] = {}
-    for model in models:
-        client = GrokClient(default_model=model)
-        correct = 0
-        for example in EVAL_SET:
-            insight = await client.analyze(example.text, model=model)
-            if sentiment_bucket(insight.sentiment_score) == example.expected_sentiment:
-                correct += 1
-        await client.close()
-        results[model] = correct / len(EVAL_SET)
-    return results
+async def evaluate_models(models: List[str], rate_limiter: Optional[TokenBucket] = None) -> Dict[str, float]:
+    # Inside the app, share its client and outbound budget; standalone, use a client scoped to this call
+    shared = current_shared_client()
+    client = shared or GrokClient(
+        rate_limiter=rate_limiter or TokenBucket(rate_per_sec=settings.outbound_rps),
+        api_key=settings.grok_api_key,
+    )
+    try:
+        # Every (model, example) pair is independent; run them all at once so calls can share batches
+        tasks = [
+            (model, example, asyncio.create_task(client.analyze(example.text, model=model)))
+            for model in models
+            for example in EVAL_SET
+        ]
+        # return_exceptions keeps one failed call from orphaning the rest; failures count as incorrect
+        outcomes = await asyncio.gather(*(task for _, _, task in tasks), return_exceptions=True)
+    finally:
+        if client is not shared:
+            await client.close()
+
+    correct = {model: 0 for model in models}
+    for (model, example, _), insight in zip(tasks, outcomes):
+        if isinstance(insight, BaseException):
+            continue
+        if sentiment_bucket(insight.sentiment_score) == example.expected_sentiment:
+            correct[model] += 1
+    return {model: correct[model] / len(EVAL_SET) for model in models}
@@ -1,18 +1,46 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import logging
 import random
 import re
-from typing import Dict, List, Optional
+import uuid
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
 
 import httpx
-from pydantic import BaseModel, ValidationError, root_validator
+import orjson
+from pydantic import BaseModel, ValidationError, field_validator, model_validator
 
 from app.config import settings
 from app.models import InsightPayload
 from app.rate_limiter import TokenBucket
 
+logger = logging.getLogger(__name__)
+
+# Single-pass keyword scans for the offline heuristic. Substring semantics (no \b) match the
+# original `word in text` checks, so "crashing" still counts as "crash". The zero-width lookahead
+# finds overlapping keywords too ("helproblem" hits both "help" and "problem").
+def _keyword_re(words) -> re.Pattern:
+    return re.compile("(?=(" + "|".join(map(re.escape, words)) + "))")
+
+
+POS_RE = _keyword_re(["love", "great", "thanks", "smooth", "fast"])
+NEG_RE = _keyword_re(["delay", "crash", "ignored", "disappointed", "help", "problem", "issue", "unresolved"])
+CLUSTER_KEYWORDS: Dict[str, str] = {
+    "crash": "app_stability",
+    "bug": "app_stability",
+    "refund": "policy_questions",
+    "policy": "policy_questions",
+    "delay": "delivery_issues",
+    "shipping": "delivery_issues",
+    "package": "delivery_issues",
+    "love": "praise",
+    "great": "praise",
+}
+CLUSTER_ORDER = ("app_stability", "policy_questions", "delivery_issues", "praise")
+CLUSTER_RE = _keyword_re(CLUSTER_KEYWORDS)
+
 
 class GrokInsight(BaseModel):
     conversation_id: str
@@ -21,42 +49,96 @@ class GrokInsight(BaseModel):
     confidence: float
     reasoning: str
 
-    @root_validator(skip_on_failure=True)
-    def clamp_values(cls, values):
-        score = values.get("sentiment_score")
-        if score is not None:
-            values["sentiment_score"] = max(-1.0, min(1.0, score))
-        conf = values.get("confidence")
-        if conf is not None:
-            values["confidence"] = max(0.0, min(1.0, conf))
-        clusters = values.get("clusters") or []
-        values["clusters"] = [str(c) for c in clusters][:10]
-        return values
+    @field_validator("clusters", mode="before")
+    @classmethod
+    def normalize_clusters(cls, value):
+        # LLM output is untrusted: only coerce real lists; anything else falls through to List[str]
+        # validation and is rejected, as it was under pydantic v1
+        if isinstance(value, list):
+            return [str(c) for c in value][:10]
+        return value
+
+    @model_validator(mode="after")
+    def clamp_values(self) -> "GrokInsight":
+        self.sentiment_score = max(-1.0, min(1.0, self.sentiment_score))
+        self.confidence = max(0.0, min(1.0, self.confidence))
+        return self
 
 
 class GrokBatchResponse(BaseModel):
     results: List[GrokInsight]
 
 
+_SYSTEM_MSG = {
+    "role": "system",
+    "content": (
+        "You are an internal conversation insights engine. "
+        "Return strict JSON with sentiment_score (-1.0 to 1.0), clusters (slug strings), confidence (0 to 1) representing certainty, and a short reasoning. "
+        "If input is ambiguous, lower the confidence."
+    ),
+}
+_USER_PREFIX = (
+    "Analyze the following conversations and respond ONLY with minified JSON matching this schema: {\"results\": [ {\"conversation_id\": str, \"sentiment_score\": float, \"clusters\": [str], \"confidence\": float, \"reasoning\": str} ] }. "
+    "Use the provided conversation_id. Do not hallucinate ids. Sentiment range -1.0 to 1.0."
+)
+
+# (item, model, future) awaiting a coalesced Grok call
+_PendingItem = Tuple[Dict[str, str], str, "asyncio.Future[InsightPayload | str]"]
+
+
 class GrokClient:
     def __init__(
         self,
+        rate_limiter: TokenBucket,
         api_key: Optional[str] = None,
         base_url: str = settings.grok_base_url,
         default_model: str = settings.grok_default_model,
         max_retries: int = settings.max_retries,
         backoff_seconds: float = settings.backoff_seconds,
-        rate_limiter: Optional[TokenBucket] = None,
+        batch_size: int = settings.batch_size,
+        batch_flush_seconds: float = settings.batch_flush_seconds,
     ):
         self.api_key = api_key
         self.base_url = base_url.rstrip("/")
         self.default_model = default_model
         self.max_retries = max_retries
         self.backoff_seconds = backoff_seconds
-        self._client = httpx.AsyncClient(timeout=30)
-        self._rate_limiter = rate_limiter or TokenBucket(rate_per_sec=settings.outbound_rps)
+        # Persistent HTTP/2 pool: concurrent Grok calls multiplex over one TLS connection.
+        # Pool settings live on the transport because httpx ignores client-level ones when a transport is given.
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0),
+                retries=0,
+            ),
+            trust_env=False,
+        )
+        self._headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        # Injected so every client in the process coordinates on one outbound budget
+        self._rate_limiter = rate_limiter
+        self.batch_size = batch_size
+        self.batch_flush_seconds = batch_flush_seconds
+        # Micro-batching: concurrent callers share Grok round trips via a single coalescer task
+        self._pending: List[_PendingItem] = []
+        self._wakeup = asyncio.Event()
+        self._coalescer: Optional[asyncio.Task] = None
+        # Dispatch task -> the chunk it serves, so close() can release those callers too
+        self._inflight: Dict[asyncio.Task, List[_PendingItem]] = {}
 
     async def close(self) -> None:
+        if self._coalescer:
+            self._coalescer.cancel()
+            self._coalescer = None
+        for task, chunk in list(self._inflight.items()):
+            task.cancel()
+            # A task cancelled before it starts never runs its body, so cancel the futures directly
+            for _, _, fut in chunk:
+                fut.cancel()
+        self._inflight.clear()
+        for _, _, fut in self._pending:
+            fut.cancel()
+        self._pending = []
         await self._client.aclose()
 
     async def analyze_batch(self, batch: List[Dict[str, str]], model: Optional[str] = None) -> Dict[str, InsightPayload | str]:
@@ -68,9 +150,80 @@ class GrokClient:
                 item["conversation_id"]: self._offline_heuristic(item["text"], model_id, item["conversation_id"])
                 for item in batch
             }
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in batch:
+            fut: asyncio.Future[InsightPayload | str] = loop.create_future()
+            self._pending.append((item, model_id, fut))
+            futures.append(fut)
+        if self._coalescer is None or self._coalescer.done():
+            self._coalescer = asyncio.create_task(self._coalesce())
+        self._wakeup.set()
+        outcomes = await asyncio.gather(*futures)
+        return {item["conversation_id"]: outcome for item, outcome in zip(batch, outcomes)}
+
+    async def analyze(self, text: str, model: Optional[str] = None, conversation_id: Optional[str] = None) -> InsightPayload:
+        # Unique preview ids let concurrent previews share one coalesced request
+        cid = conversation_id or f"preview_{uuid.uuid4().hex[:12]}"
+        results = await self.analyze_batch([
+            {"conversation_id": cid, "text": text}
+        ], model=model)
+        output = results.get(cid)
+        if isinstance(output, InsightPayload):
+            return output
+        raise RuntimeError(output or "Unknown Grok error")
+
+    async def _coalesce(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            pending: List[_PendingItem] = []
+            dispatched: Set[int] = set()
+            try:
+                await self._wakeup.wait()
+                deadline = loop.time() + self.batch_flush_seconds
+                while len(self._pending) < self.batch_size:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=max(deadline - loop.time(), 0))
+                    except asyncio.TimeoutError:
+                        break
+                self._wakeup.clear()
+                pending, self._pending = self._pending, []
+                for model, chunk in self._chunk(pending):
+                    task = asyncio.create_task(self._dispatch(chunk, model))
+                    self._inflight[task] = chunk
+                    task.add_done_callback(lambda t: self._inflight.pop(t, None))
+                    dispatched.update(id(fut) for _, _, fut in chunk)
+            except Exception as exc:  # noqa: BLE001
+                # Never leave callers waiting: fail whatever this round had not handed to a dispatch
+                logger.exception("Grok coalescer failed")
+                for _, _, fut in pending:
+                    if id(fut) not in dispatched and not fut.done():
+                        fut.set_result(f"grok_error: {exc}")
+
+    def _chunk(self, pending: List[_PendingItem]) -> List[Tuple[str, List[_PendingItem]]]:
+        # One request per model, at most batch_size items, and conversation ids unique per request
+        chunks: List[Tuple[str, List[_PendingItem]]] = []
+        for entry in pending:
+            item, model, fut = entry
+            if fut.done():  # caller went away
+                continue
+            for chunk_model, chunk in chunks:
+                if (
+                    chunk_model == model
+                    and len(chunk) < self.batch_size
+                    and all(other["conversation_id"] != item["conversation_id"] for other, _, _ in chunk)
+                ):
+                    chunk.append(entry)
+                    break
+            else:
+                chunks.append((model, [entry]))
+        return chunks
+
+    async def _dispatch(self, chunk: List[_PendingItem], model: str) -> None:
         await self._rate_limiter.acquire()
         try:
-            grok_results = await self._call_api(batch, model_id)
+            grok_results = await self._call_api([item for item, _, _ in chunk], model)
             parsed: Dict[str, InsightPayload | str] = {}
             for result in grok_results:
                 parsed[result.conversation_id] = InsightPayload(
@@ -79,72 +232,46 @@ class GrokClient:
                     clusters=result.clusters,
                     confidence=result.confidence,
                     reasoning=result.reasoning,
-                    model=model_id,
-                    raw_response=result.dict(),
+                    model=model,
+                    raw_response=result.model_dump(),
                 )
-            # Mark missing entries as failures without blocking batch
-            missing = {item["conversation_id"] for item in batch} - set(parsed.keys())
-            for cid in missing:
-                parsed[cid] = "No response from Grok for conversation"
-            return parsed
         except Exception as exc:  # noqa: BLE001
-            return {item["conversation_id"]: f"grok_error: {exc}" for item in batch}
-
-    async def analyze(self, text: str, model: Optional[str] = None, conversation_id: Optional[str] = None) -> InsightPayload:
-        cid = conversation_id or "preview"
-        results = await self.analyze_batch([
-            {"conversation_id": cid, "text": text}
-        ], model=model)
-        output = results.get(cid)
-        if isinstance(output, InsightPayload):
-            return output
-        raise RuntimeError(output or "Unknown Grok error")
+            parsed = {item["conversation_id"]: f"grok_error: {exc}" for item, _, _ in chunk}
+        for item, _, fut in chunk:
+            if not fut.done():
+                # Mark missing entries as failures without blocking batch
+                fut.set_result(parsed.get(item["conversation_id"], "No response from Grok for conversation"))
 
     async def _call_api(self, batch: List[Dict[str, str]], model: str) -> List[GrokInsight]:
         url = f"{self.base_url}/chat/completions"
-        formatted_conversations = "\n".join(
-            [f"- id: {item['conversation_id']}, text: {item['text']}" for item in batch]
-        )
+        lines = (f"- id: {item['conversation_id']}, text: {item['text']}" for item in batch)
         payload = {
             "model": model,
             "messages": [
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an internal conversation insights engine. "
-                        "Return strict JSON with sentiment_score (-1.0 to 1.0), clusters (slug strings), confidence (0 to 1) representing certainty, and a short reasoning. "
-                        "If input is ambiguous, lower the confidence."
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        "Analyze the following conversations and respond ONLY with minified JSON matching this schema: {\"results\": [ {\"conversation_id\": str, \"sentiment_score\": float, \"clusters\": [str], \"confidence\": float, \"reasoning\": str} ] }. "
-                        "Use the provided conversation_id. Do not hallucinate ids. Sentiment range -1.0 to 1.0."
-                        f"\n\n{formatted_conversations}"
-                    ),
-                },
+                _SYSTEM_MSG,
+                {"role": "user", "content": _USER_PREFIX + "\n\n" + "\n".join(lines)},
             ],
             "response_format": {"type": "json_object"},
         }
-        headers = {"Authorization": f"Bearer {self.api_key}"}
+        # Serialize once up front; retries resend the same bytes
+        body = orjson.dumps(payload)
 
         for attempt in range(1, self.max_retries + 1):
             try:
-                resp = await self._client.post(url, json=payload, headers=headers)
+                resp = await self._client.post(url, content=body, headers=self._headers)
                 if resp.status_code == 429:
                     retry_after = float(resp.headers.get("Retry-After", "1"))
                     await asyncio.sleep(retry_after)
                     continue
                 resp.raise_for_status()
-                raw = resp.json()
+                raw = orjson.loads(resp.content)
                 content = raw.get("choices", [{}])[0].get("message", {}).get("content")
                 if not content:
                     raise ValueError("Empty Grok response")
-                data = json.loads(content)
-                parsed = GrokBatchResponse.parse_obj(data)
+                data = orjson.loads(content)
+                parsed = GrokBatchResponse.model_validate(data)
                 return parsed.results
-            except (httpx.HTTPError, json.JSONDecodeError, ValidationError, ValueError) as exc:
+            except (httpx.HTTPError, orjson.JSONDecodeError, ValidationError, ValueError) as exc:
                 if attempt == self.max_retries:
                     raise exc
                 sleep_for = self.backoff_seconds * (2 ** (attempt - 1))
@@ -152,44 +279,63 @@ class GrokClient:
         raise RuntimeError("Unexpected retry exhaustion")
 
     def _offline_heuristic(self, text: str, model: str, conversation_id: str) -> InsightPayload:
-        text_lower = text.lower()
-        sentiment_words = {
-            "positive": ["love", "great", "thanks", "smooth", "fast"],
-            "negative": ["delay", "crash", "ignored", "disappointed", "help", "problem", "issue", "unresolved"],
-        }
-        score = 0.0
-        for word in sentiment_words["positive"]:
-            if word in text_lower:
-                score += 0.25
-        for word in sentiment_words["negative"]:
-            if word in text_lower:
-                score -= 0.3
-        score = max(-1.0, min(1.0, score))
-
-        clusters = []
-        if "crash" in text_lower or "bug" in text_lower:
-            clusters.append("app_stability")
-        if "refund" in text_lower or "policy" in text_lower:
-            clusters.append("policy_questions")
-        if "delay" in text_lower or "shipping" in text_lower or "package" in text_lower:
-            clusters.append("delivery_issues")
-        if "love" in text_lower or "great" in text_lower:
-            clusters.append("praise")
-        if not clusters:
-            clusters.append("general_support")
-
-        if "?" in text or "anyone" in text_lower or text_lower.startswith("where"):
-            clusters.append("knowledge_gap")
-
+        score, clusters, reasoning = _heuristic_core(text.lower(), model)
         confidence = 0.45 + 0.2 * random.random()
-        reasoning = f"Heuristic {model} inference based on keywords and hashtags."
 
         return InsightPayload(
             conversation_id=conversation_id,
             sentiment_score=score,
-            clusters=clusters,
+            clusters=list(clusters),
             confidence=round(confidence, 2),
             reasoning=reasoning,
             model=model,
             raw_response={"source": "heuristic"},
         )
+
+
+_shared_client: Optional[GrokClient] = None
+
+
+def get_shared_client(rate_limiter: Optional[TokenBucket] = None) -> GrokClient:
+    # One client (httpx pool, coalescer, outbound limiter) for the running app. main.py creates it in
+    # startup_event with the app-wide outbound_limiter and closes it on shutdown; later callers may
+    # omit the limiter.
+    global _shared_client
+    if _shared_client is None:
+        if rate_limiter is None:
+            raise RuntimeError("Shared GrokClient is not configured; pass rate_limiter on first use")
+        _shared_client = GrokClient(rate_limiter=rate_limiter, api_key=settings.grok_api_key)
+    elif rate_limiter is not None and rate_limiter is not _shared_client._rate_limiter:
+        raise RuntimeError("Shared GrokClient already uses a different rate limiter")
+    return _shared_client
+
+
+def current_shared_client() -> Optional[GrokClient]:
+    return _shared_client
+
+
+async def close_shared_client() -> None:
+    global _shared_client
+    if _shared_client is not None:
+        client, _shared_client = _shared_client, None
+        await client.close()
+
+
+# Pure and keyed on (text, model), so repeated texts (evals, replays) skip the keyword scan.
+# Clusters are returned as a tuple so cached values can't be mutated by callers.
+@lru_cache(maxsize=4096)
+def _heuristic_core(text_lower: str, model: str) -> Tuple[float, Tuple[str, ...], str]:
+    # Each keyword contributes once regardless of repeats, as before
+    score = 0.25 * len(set(POS_RE.findall(text_lower))) - 0.3 * len(set(NEG_RE.findall(text_lower)))
+    score = max(-1.0, min(1.0, score))
+
+    matched = {CLUSTER_KEYWORDS[m.group(1)] for m in CLUSTER_RE.finditer(text_lower)}
+    clusters = [label for label in CLUSTER_ORDER if label in matched]
+    if not clusters:
+        clusters.append("general_support")
+
+    if "?" in text_lower or "anyone" in text_lower or text_lower.startswith("where"):
+        clusters.append("knowledge_gap")
+
+    reasoning = f"Heuristic {model} inference based on keywords and hashtags."
+    return score, tuple(clusters), reasoning
@@ -1,10 +1,13 @@
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel, Field, root_validator, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 
 
 class Message(BaseModel):
+    # Keep the v1 ingest contract: numeric ids/text are accepted and stored as strings
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
     author_id: Optional[str] = Field(None, description="External user identifier")
     text: str = Field(..., min_length=1)
     timestamp: Optional[datetime] = None
@@ -12,11 +15,14 @@ class Message(BaseModel):
 
 
 class ConversationIn(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
     conversation_id: Optional[str] = Field(None, description="Caller-provided id; if omitted server generates one")
     messages: List[Message]
     metadata: Dict[str, Any] = Field(default_factory=dict)
 
-    @validator("messages")
+    @field_validator("messages")
+    @classmethod
     def validate_messages(cls, value: List[Message]) -> List[Message]:
         if not value:
             raise ValueError("messages cannot be empty")
@@ -46,15 +52,11 @@ class InsightPayload(BaseModel):
     model: str
     raw_response: Dict[str, Any]
 
-    @root_validator(skip_on_failure=True)
-    def clamp_values(cls, values: Dict[str, Any]) -> Dict[str, Any]:
-        score = values.get("sentiment_score")
-        if score is not None:
-            values["sentiment_score"] = max(-1.0, min(1.0, score))
-        conf = values.get("confidence")
-        if conf is not None:
-            values["confidence"] = max(0.0, min(1.0, conf))
-        return values
+    @model_validator(mode="after")
+    def clamp_values(self) -> "InsightPayload":
+        self.sentiment_score = max(-1.0, min(1.0, self.sentiment_score))
+        self.confidence = max(0.0, min(1.0, self.confidence))
+        return self
 
 
 class InsightResponse(BaseModel):
@@ -74,14 +76,14 @@ class InsightsQuery(BaseModel):
         None, description="Filter sentiment bucket: positive|neutral|negative"
     )
 
-    @validator("end_time")
-    def validate_range(cls, v: datetime, values: Dict[str, Any]) -> datetime:
-        start = values.get("start_time")
-        if start and v <= start:
+    @model_validator(mode="after")
+    def validate_range(self) -> "InsightsQuery":
+        if self.end_time <= self.start_time:
             raise ValueError("end_time must be after start_time")
-        return v
+        return self
 
-    @validator("sentiment")
+    @field_validator("sentiment")
+    @classmethod
     def validate_sentiment(cls, v: Optional[str]) -> Optional[str]:
         if v is None:
             return v
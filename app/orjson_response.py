@@ -0,0 +1,12 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import Response
+
+
+class ORJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        # orjson handles datetime natively; default=str covers anything else (e.g. Decimal)
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
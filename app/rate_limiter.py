@@ -2,7 +2,8 @@ from __future__ import annotations
 
 import asyncio
 import time
-from typing import Optional, Tuple
+from collections import deque
+from typing import Deque, Optional, Tuple
 
 
 class TokenBucket:
@@ -12,6 +13,9 @@ class TokenBucket:
         self.tokens = float(self.capacity)
         self.updated_at = time.monotonic()
         self._lock = asyncio.Lock()
+        # FIFO of blocked acquirers; a single timer wakes exactly the next one when a token is due
+        self._waiters: Deque[asyncio.Future[None]] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
 
     def _refill(self) -> None:
         now = time.monotonic()
@@ -22,14 +26,42 @@ class TokenBucket:
         self.updated_at = now
 
     async def acquire(self) -> None:
-        while True:
-            async with self._lock:
-                self._refill()
-                if self.tokens >= 1:
-                    self.tokens -= 1
-                    return
-                wait_for = (1 - self.tokens) / self.rate
-            await asyncio.sleep(wait_for)
+        # No awaits between refill and decrement, so the fast path needs no lock
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._schedule()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Token was granted just before cancellation; hand it back
+                self.tokens = min(self.capacity, self.tokens + 1)
+                self._schedule()
+            raise
+
+    def _schedule(self) -> None:
+        if self._timer is not None or not self._waiters:
+            return
+        wait_for = max((1 - self.tokens) / self.rate, 0.0)
+        self._timer = asyncio.get_running_loop().call_later(wait_for, self._grant)
+
+    def _grant(self) -> None:
+        self._timer = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            waiter = self._waiters.popleft()
+            if waiter.done():  # cancelled while queued
+                continue
+            self.tokens -= 1
+            waiter.set_result(None)
+        # Drop cancelled waiters at the head so an idle timer isn't scheduled for them
+        while self._waiters and self._waiters[0].done():
+            self._waiters.popleft()
+        self._schedule()
 
     async def try_acquire(self) -> Tuple[bool, float]:
         async with self._lock:
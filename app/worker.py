@@ -1,30 +1,51 @@
 import asyncio
-import json
-from typing import Dict, List
+import logging
+from typing import Dict, List, Optional, Set
 
 from app import db
 from app.config import settings
-from app.grok_client import GrokClient
+from app.grok_client import GrokClient, get_shared_client
 from app.models import InsightPayload
 
+logger = logging.getLogger(__name__)
+
 
 class ProcessingWorker:
-    def __init__(self, queue: asyncio.Queue[str]):
+    def __init__(self, queue: asyncio.Queue[str], client: Optional[GrokClient] = None):
         self.queue = queue
         self._stop_event = asyncio.Event()
-        self._client = GrokClient(api_key=settings.grok_api_key)
+        # Resolved in start(): the shared client only exists while the app is running
+        self._client_override = client
+        self._client: Optional[GrokClient] = None
+        # Bounds concurrent Grok batches so a slow API backs up into the bounded queue instead of memory
+        self._sem = asyncio.Semaphore(settings.max_inflight_batches)
+        self._inflight: Set[asyncio.Task] = set()
+        self._loop_task: Optional[asyncio.Task] = None
 
     async def start(self) -> None:
+        self._loop_task = asyncio.current_task()
+        self._client = self._client_override or get_shared_client()
         await db.init_db()
-        outstanding = await db.load_outstanding(limit=500)
+        # Never reseed more than the bounded queue holds, or start() would block before draining
+        outstanding = await db.load_outstanding(limit=min(500, self.queue.maxsize or 500))
         for cid in outstanding:
             await self.queue.put(cid)
         while not self._stop_event.is_set():
             await self._drain_once()
 
     async def shutdown(self) -> None:
+        # Let the drain loop and in-flight batches finish so no rows are stranded in `processing`.
+        # The Grok client and DB are shared; their owner closes them after this returns.
         self._stop_event.set()
-        await self._client.close()
+        timeout = settings.shutdown_timeout_seconds
+        if self._loop_task and self._loop_task is not asyncio.current_task():
+            await asyncio.wait({self._loop_task}, timeout=timeout)
+            self._loop_task.cancel()
+        if self._inflight:
+            _, pending = await asyncio.wait(set(self._inflight), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
 
     async def _drain_once(self) -> None:
         batch: List[str] = []
@@ -41,46 +62,74 @@ class ProcessingWorker:
                 break
 
         if not batch:
+            await self._sweep()
             await asyncio.sleep(0.05)
             return
 
-        rows = await db.fetch_conversations(batch)
-        ready = [row for row in rows if row["status"] == "queued"]
-        ready_ids = [row["conversation_id"] for row in ready]
-        if not ready_ids:
+        # Take a slot before claiming so claimed rows always have a batch running for them
+        await self._sem.acquire()
+        try:
+            claimed = await db.claim_conversations(batch)
+        except BaseException:
+            self._sem.release()
+            raise
+        if not claimed:
+            self._sem.release()
             return
-        await db.mark_status(ready_ids, status="processing")
 
         payloads = [
             {
                 "conversation_id": row["conversation_id"],
-                "text": _conversation_text(json.loads(row["payload"])),
+                "text": row["prompt_text"] or "",
             }
-            for row in ready
+            for row in claimed
         ]
 
-        results = await self._client.analyze_batch(payloads, model=settings.grok_default_model)
-
-        successes: List[InsightPayload] = []
-        failures: Dict[str, str] = {}
-        for cid, result in results.items():
-            if isinstance(result, InsightPayload):
-                successes.append(result)
-            else:
-                failures[cid] = str(result)
-
-        if successes:
-            await db.store_insights(successes)
-            await db.mark_status([i.conversation_id for i in successes], status="completed")
-        if failures:
-            await db.mark_status(list(failures.keys()), status="failed", error="; ".join(failures.values()))
-
-
-def _conversation_text(payload: Dict[str, object]) -> str:
-    messages = payload.get("messages") or []
-    if isinstance(messages, list):
-        return "\n".join([
-            f"{msg.get('author_id', 'user')}: {msg.get('text', '')}" if isinstance(msg, dict) else str(msg)
-            for msg in messages
-        ])
-    return str(payload)
+        task = asyncio.create_task(self._process_batch(payloads))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _sweep(self) -> None:
+        # Ingest drops the id handoff when this queue is full and leaves the row `queued`;
+        # pick such rows up whenever the worker goes idle
+        free = self.queue.maxsize - self.queue.qsize() if self.queue.maxsize else 500
+        if free <= 0:
+            return
+        for cid in await db.load_outstanding(limit=min(free, 500), statuses=("queued",)):
+            try:
+                self.queue.put_nowait(cid)
+            except asyncio.QueueFull:
+                break
+
+    async def _process_batch(self, payloads: List[Dict[str, str]]) -> None:
+        try:
+            results = await self._client.analyze_batch(payloads, model=settings.grok_default_model)
+
+            successes: List[InsightPayload] = []
+            failures: Dict[str, str] = {}
+            for cid, result in results.items():
+                if isinstance(result, InsightPayload):
+                    successes.append(result)
+                else:
+                    failures[cid] = str(result)
+
+            if successes:
+                await db.store_insights(successes)
+                await db.mark_status([i.conversation_id for i in successes], status="completed")
+            if failures:
+                await db.mark_status(list(failures.keys()), status="failed", error="; ".join(failures.values()))
+        except asyncio.CancelledError:
+            # Cancelled at shutdown: hand the rows back so the next start reclaims them
+            await db.mark_status([p["conversation_id"] for p in payloads], status="queued")
+            raise
+        except Exception as exc:  # noqa: BLE001
+            # Fire-and-forget task: log here, and never leave claimed rows stuck in `processing`
+            logger.exception("processing batch of %d conversations failed", len(payloads))
+            try:
+                await db.mark_status(
+                    [p["conversation_id"] for p in payloads], status="failed", error=f"worker_error: {exc}"
+                )
+            except Exception:  # noqa: BLE001
+                logger.exception("could not mark failed batch; rows remain in processing")
+        finally:
+            self._sem.release()
@@ -1,29 +1,44 @@
 import asyncio
+import logging
 import uuid
-from typing import Optional
+from typing import List, Optional, Tuple
 
+import orjson
 from fastapi import Depends, FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
 
 from app import db
 from app.config import settings
+from app.grok_client import close_shared_client, get_shared_client
 from app.models import ConversationIn, InsightsQuery
+from app.orjson_response import ORJSONResponse
 from app.rate_limiter import TokenBucket
 from app.worker import ProcessingWorker
 
 
-app = FastAPI(title="Backend Engineer Insights Platform", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="Backend Engineer Insights Platform",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+)
 inbound_limiter = TokenBucket(rate_per_sec=settings.inbound_rps)
-processing_queue: asyncio.Queue[str] = asyncio.Queue()
+outbound_limiter = TokenBucket(rate_per_sec=settings.outbound_rps)
+# Bounded so ingest sheds load (503) instead of buffering without limit when Grok falls behind
+max_queue_size = settings.batch_size * 64
+processing_queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_queue_size)
 worker = ProcessingWorker(queue=processing_queue)
 worker_task: Optional[asyncio.Task] = None
+# Write-behind buffer: ingest returns immediately and conversations are persisted in batches
+pending_enqueues: asyncio.Queue[Tuple[str, str, str]] = asyncio.Queue(maxsize=max_queue_size)
+write_behind_task: Optional[asyncio.Task] = None
 
 
 @app.middleware("http")
 async def enforce_rps(request: Request, call_next):
     allowed, retry_after = await inbound_limiter.try_acquire()
     if not allowed:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=429,
             content={"error": "Too Many Requests"},
             headers={"Retry-After": f"{retry_after:.2f}"},
@@ -31,25 +46,102 @@ async def enforce_rps(request: Request, call_next):
     return await call_next(request)
 
 
+async def write_behind() -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        items: List[Tuple[str, str, str]] = [await pending_enqueues.get()]
+        deadline = loop.time() + settings.batch_flush_seconds
+        while len(items) < settings.batch_size:
+            try:
+                items.append(await asyncio.wait_for(pending_enqueues.get(), timeout=max(deadline - loop.time(), 0)))
+            except asyncio.TimeoutError:
+                break
+        try:
+            await _flush_enqueues(items)
+        except Exception:  # noqa: BLE001
+            logger.exception("write-behind flush failed for %d conversations", len(items))
+        finally:
+            for _ in items:
+                pending_enqueues.task_done()
+
+
+async def _flush_enqueues(items: List[Tuple[str, str, str]], handoff: bool = True) -> None:
+    try:
+        await db.enqueue_conversations(items)
+        written = items
+    except Exception:  # noqa: BLE001
+        # Retry row by row so one bad row can't take the rest of the batch with it
+        logger.exception("batched enqueue failed; retrying %d conversations individually", len(items))
+        written = []
+        for item in items:
+            try:
+                await db.enqueue_conversations([item])
+                written.append(item)
+            except Exception:  # noqa: BLE001
+                logger.exception("failed to persist conversation %s", item[0])
+    if not handoff:
+        return
+    # Only hand ids to the worker once their rows are committed. Never block persistence on a full
+    # processing queue: overflow rows stay `queued` and the worker's idle sweep picks them up.
+    for conversation_id, _, _ in written:
+        try:
+            processing_queue.put_nowait(conversation_id)
+        except asyncio.QueueFull:
+            break
+
+
 @app.on_event("startup")
 async def startup_event() -> None:
     await db.init_db()
-    global worker_task
+    await db.analyze()
+    # Created inside the running loop so its httpx pool and coalescer belong to it
+    get_shared_client(rate_limiter=outbound_limiter)
+    global worker_task, write_behind_task
+    write_behind_task = asyncio.create_task(write_behind())
     worker_task = asyncio.create_task(worker.start())
 
 
 @app.on_event("shutdown")
 async def shutdown_event() -> None:
+    if write_behind_task:
+        if not write_behind_task.done():
+            try:
+                await asyncio.wait_for(pending_enqueues.join(), timeout=settings.shutdown_timeout_seconds)
+            except asyncio.TimeoutError:
+                logger.warning("write-behind did not drain within timeout; flushing remainder directly")
+        write_behind_task.cancel()
+        # Anything still buffered already got a 202: persist it (as `queued`, for the next start)
+        leftovers: List[Tuple[str, str, str]] = []
+        while not pending_enqueues.empty():
+            leftovers.append(pending_enqueues.get_nowait())
+            pending_enqueues.task_done()
+        if leftovers:
+            await _flush_enqueues(leftovers, handoff=False)
+    await worker.shutdown()
     if worker_task:
         worker_task.cancel()
-    await worker.shutdown()
+    await close_shared_client()
+    await db.close_connection()
 
 
 @app.post("/api/v1/conversations", status_code=202)
 async def create_conversation(payload: ConversationIn):
     conversation_id = payload.conversation_id or f"conv_{uuid.uuid4().hex[:12]}"
-    await db.enqueue_conversation(conversation_id, payload.dict())
-    await processing_queue.put(conversation_id)
+    # Serialize here so unencodable payloads (e.g. ints beyond 64 bits in metadata) fail this
+    # request instead of the background write-behind flush
+    try:
+        payload_json = orjson.dumps(payload.model_dump()).decode()
+    except orjson.JSONEncodeError as exc:
+        raise HTTPException(status_code=422, detail=f"payload is not JSON-serializable: {exc}")
+    try:
+        # The worker only needs the prompt text, so derive it once here rather than on every drain
+        pending_enqueues.put_nowait((conversation_id, payload_json, payload.combined_text))
+    except asyncio.QueueFull:
+        return ORJSONResponse(
+            status_code=503,
+            content={"error": "Processing queue is full"},
+            headers={"Retry-After": f"{settings.batch_flush_seconds:.2f}"},
+        )
     return {
         "status": "accepted",
         "conversation_id": conversation_id,
@@ -79,7 +171,8 @@ async def query_params(
 @app.get("/api/v1/insights")
 async def list_insights(filters: InsightsQuery = Depends(query_params)):
     insights, total_count = await db.query_insights(filters)
-    return {
+    # Return the response directly so FastAPI skips jsonable_encoder on large result sets
+    return ORJSONResponse({
         "metadata": {
             "total_count": total_count,
             "returned_count": len(insights),
@@ -89,7 +182,7 @@ async def list_insights(filters: InsightsQuery = Depends(query_params)):
             },
         },
         "data": insights,
-    }
+    })
 
 
 @app.get("/healthz")